@@ -1,12 +1,47 @@
-from flask import Flask, session
-from routes.shop_routes import shop_bp, query_db   # Import blueprint
+import os
+import time
+
+# Startup profile mode: STARTUP_PROFILE=1 reports import and first-request time
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE") == "1"
+_boot_started = time.perf_counter()
+
+from flask import Flask, session, g
+from jinja2 import FileSystemBytecodeCache
+from routes.shop_routes import shop_bp, query_db, warm_caches   # Import blueprint
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 
+# Compiled templates are cached on disk so new workers skip Jinja compilation.
+# Must be set before anything touches app.jinja_env.
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", os.path.join(app.root_path, ".jinja_cache"))
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(JINJA_CACHE_DIR)}
+
 # Register Blueprint
 app.register_blueprint(shop_bp)
 
+# Build catalog caches and compile templates once. Under gunicorn with
+# preload_app this runs in the master and is shared with every forked worker.
+warm_caches(app)
+
+if STARTUP_PROFILE:
+    print(f"[startup] pid={os.getpid()} import+warm: {(time.perf_counter() - _boot_started) * 1000:.1f} ms")
+    _first_request_pending = True
+
+    @app.before_request
+    def _profile_request_start():
+        g._profile_started = time.perf_counter()
+
+    @app.after_request
+    def _profile_first_request(response):
+        global _first_request_pending
+        if _first_request_pending:
+            _first_request_pending = False
+            elapsed = (time.perf_counter() - g._profile_started) * 1000
+            print(f"[startup] pid={os.getpid()} first request: {elapsed:.1f} ms")
+        return response
+
 @app.before_request
 def clear_invalid_session():
     user_id = session.get("user_id")
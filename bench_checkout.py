@@ -0,0 +1,132 @@
+"""Flash-sale benchmark: many concurrent buyers checking out one hot SKU.
+
+    python bench_checkout.py [--processes 4] [--threads 8] [--buyers 4000] [--stock 1000] [--naive]
+
+Runs against a throwaway copy of database.db. Each buyer reserves one unit and
+places an order, like /checkout/reserve + /checkout/confirm. --naive gives
+every buyer its own BEGIN IMMEDIATE transaction instead of the group-committed
+writer, for comparison. Checks that exactly --stock orders succeed and that
+stock ends at zero.
+
+The defaults match gunicorn.conf.py (gthread workers, 8 threads each).
+Group commit only batches checkouts that are in flight together in one
+process: with --threads 1 (a sync worker) it runs at the --naive rate.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from routes import orders
+
+
+def naive_checkout(database, holder, product_id):
+    conn = sqlite3.connect(database, timeout=orders.BUSY_TIMEOUT, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            orders._reserve(conn, holder, [(product_id, 1)], orders.RESERVATION_TTL)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            orders._place_order(conn, holder, [(product_id, 1, None)], None)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def worker(database, product_id, buyers, threads, naive, results):
+    counts = {"ok": 0, "sold_out": 0, "error": 0}
+    lock = threading.Lock()
+    pid = os.getpid()
+
+    def buy(start):
+        for n in range(start, buyers, threads):
+            holder = f"{pid}-{n}"
+            try:
+                if naive:
+                    naive_checkout(database, holder, product_id)
+                else:
+                    orders.reserve_stock(database, holder, [(product_id, 1)])
+                    orders.place_order(database, holder, [(product_id, 1, None)])
+                key = "ok"
+            except orders.OutOfStock:
+                key = "sold_out"
+            except sqlite3.OperationalError:
+                key = "error"  # "database is locked" after BUSY_TIMEOUT
+            with lock:
+                counts[key] += 1
+
+    pool = [threading.Thread(target=buy, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="per process, like gunicorn's threads")
+    parser.add_argument("--buyers", type=int, default=4000, help="total buyers across all processes")
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--naive", action="store_true")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    database = os.path.join(tmpdir, "bench.db")
+    shutil.copy("database.db", database)
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA journal_mode=WAL")
+    product_id = conn.execute(
+        "INSERT INTO products (name, price, image, description, category, store, stock) "
+        "VALUES ('Hot SKU', 9.99, '', '', 'electronics', 'Bench Store', ?)", (args.stock,)
+    ).lastrowid
+    conn.commit()
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    per_process = args.buyers // args.processes
+    started = time.perf_counter()
+    procs = [ctx.Process(target=worker, args=(database, product_id, per_process, args.threads, args.naive, results))
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    totals = {"ok": 0, "sold_out": 0, "error": 0}
+    for _ in procs:
+        for key, value in results.get().items():
+            totals[key] += value
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    stock = conn.execute("SELECT stock FROM products WHERE id=?", (product_id,)).fetchone()[0]
+    sold = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id=?", (product_id,)).fetchone()[0]
+    conn.close()
+    shutil.rmtree(tmpdir)
+
+    attempts = per_process * args.processes
+    print(f"mode: {'naive' if args.naive else 'group commit'}  "
+          f"{args.processes} processes x {args.threads} threads, {attempts} buyers, stock {args.stock}")
+    print(f"orders: {totals['ok']}  sold out: {totals['sold_out']}  lock errors: {totals['error']}")
+    print(f"elapsed: {elapsed:.2f}s  ({attempts / elapsed:.0f} checkouts/s)")
+    print(f"final stock: {stock}  units sold: {sold}")
+    expected = min(args.stock, attempts)
+    if sold != totals["ok"] or stock != args.stock - sold or (totals["error"] == 0 and sold != expected):
+        raise SystemExit("FAIL: stock and orders disagree")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Offline "frequently bought together" job.
+
+    python build_recommendations.py [--workers 4] [--chunk 5000] [--top 8] [--full]
+
+Mines co-occurring product pairs from placed orders (order_items grouped by
+order) and from saved carts (cart rows grouped by user), keeps running pair
+counts in product_pairs, and writes the top --top partners of every product
+touched into product_recommendations, which the product and cart pages read
+with one indexed query.
+
+Incremental: recommendation_state remembers the last order_items.order_id and
+cart.id processed, so a run only reads newer rows. --full starts over.
+
+The new id range is cut into --chunk sized shards that a process pool mines in
+parallel. Each shard streams its rows from its own read-only connection and
+returns the pair counts for that shard alone; the parent folds each shard into
+the database in its own short transaction, together with the shard's end id in
+recommendation_state and the touched products in recommendation_dirty, so
+memory stays bounded by chunk size x workers and an interrupted run resumes
+without counting anything twice. Re-ranking drains recommendation_dirty, so
+products folded by an interrupted run are re-ranked by the next one.
+
+Tables are created by setup_db.py.
+"""
+import argparse
+import multiprocessing
+import sqlite3
+import time
+from collections import Counter
+
+DATABASE = "database.db"
+
+# Both sides of each pair, so a product's partners are a prefix scan on product_a
+ORDER_PAIRS = """
+    SELECT DISTINCT a.order_id, a.product_id, b.product_id
+    FROM order_items a JOIN order_items b
+      ON b.order_id = a.order_id AND b.product_id != a.product_id
+    WHERE a.order_id BETWEEN ? AND ?
+"""
+# A cart row pairs with the products in the same user's earlier rows; later
+# rows are counted when they arrive. Only a product's first row in the cart
+# pairs at all, so a pair counts once per user however many rows repeat it.
+CART_PAIRS = """
+    SELECT DISTINCT a.id, a.product_id, b.product_id
+    FROM cart a JOIN cart b
+      ON b.user_id = a.user_id AND b.id < a.id AND b.product_id != a.product_id
+    WHERE a.id BETWEEN ? AND ? AND a.user_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM cart c
+          WHERE c.user_id = a.user_id AND c.product_id = a.product_id AND c.id < a.id
+      )
+"""
+
+SOURCES = {
+    # source: (query, sql for the highest id available)
+    "orders": (ORDER_PAIRS, "SELECT MAX(order_id) FROM order_items"),
+    "cart": (CART_PAIRS, "SELECT MAX(id) FROM cart"),
+}
+
+
+def mine_shard(task):
+    database, source, lo, hi = task
+    query = SOURCES[source][0]
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    counts = Counter()
+    for _, a, b in conn.execute(query, (lo, hi)):
+        counts[(a, b)] += 1
+        if source == "cart":
+            counts[(b, a)] += 1  # cart pairs are only emitted one way round
+    conn.close()
+    return counts
+
+
+def fold(conn, source, last_id, counts):
+    conn.executemany("""
+        INSERT INTO product_pairs (product_a, product_b, count) VALUES (?, ?, ?)
+        ON CONFLICT (product_a, product_b) DO UPDATE SET count = count + excluded.count
+    """, [(a, b, n) for (a, b), n in counts.items()])
+    conn.executemany("INSERT OR IGNORE INTO recommendation_dirty (product_id) VALUES (?)",
+                     [(a,) for a in {a for a, _ in counts}])
+    conn.execute("""
+        INSERT INTO recommendation_state (source, last_id) VALUES (?, ?)
+        ON CONFLICT (source) DO UPDATE SET last_id = excluded.last_id
+    """, (source, last_id))
+    conn.commit()
+
+
+def rebuild_top(conn, top):
+    """Re-rank every product in recommendation_dirty; returns how many."""
+    done = 0
+    while True:
+        chunk = [r[0] for r in conn.execute("SELECT product_id FROM recommendation_dirty ORDER BY product_id LIMIT 500")]
+        if not chunk:
+            return done
+        marks = ",".join("?" * len(chunk))
+        conn.execute(f"DELETE FROM product_recommendations WHERE product_id IN ({marks})", chunk)
+        conn.execute(f"""
+            INSERT INTO product_recommendations (product_id, rank, recommended_id, score)
+            SELECT product_a, rank, product_b, count FROM (
+                SELECT product_a, product_b, count,
+                       ROW_NUMBER() OVER (PARTITION BY product_a ORDER BY count DESC, product_b) AS rank
+                FROM product_pairs WHERE product_a IN ({marks})
+            ) WHERE rank <= ?
+        """, chunk + [top])
+        conn.execute(f"DELETE FROM recommendation_dirty WHERE product_id IN ({marks})", chunk)
+        conn.commit()
+        done += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk", type=int, default=5000, help="ids per shard")
+    parser.add_argument("--top", type=int, default=8, help="recommendations kept per product")
+    parser.add_argument("--full", action="store_true", help="discard counts and mine everything again")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.database, timeout=10)
+    if args.full:
+        conn.executescript("""
+            DELETE FROM product_pairs;
+            DELETE FROM product_recommendations;
+            DELETE FROM recommendation_state;
+            DELETE FROM recommendation_dirty;
+        """)
+
+    tasks = []
+    for source, (_, max_sql) in SOURCES.items():
+        row = conn.execute("SELECT last_id FROM recommendation_state WHERE source=?", (source,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute(max_sql).fetchone()[0] or 0
+        for lo in range(last_id + 1, max_id + 1, args.chunk):
+            tasks.append((args.database, source, lo, min(lo + args.chunk - 1, max_id)))
+
+    pairs = 0
+    with multiprocessing.Pool(args.workers) as pool:
+        # imap keeps shard order so last_id only ever moves past finished shards
+        for task, counts in zip(tasks, pool.imap(mine_shard, tasks)):
+            _, source, _, hi = task
+            pairs += len(counts)
+            fold(conn, source, hi, counts)
+
+    reranked = rebuild_top(conn, args.top)
+    conn.close()
+    print(f"{len(tasks)} shards, {pairs} pair updates, {reranked} products re-ranked "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Query-plan regression check for the shop blueprint.
+
+    python check_query_plans.py            # check against query_plans.json
+    python check_query_plans.py --update   # accept the current plans as the new baseline
+
+Builds a throwaway database with setup_db.py (never the live database.db,
+whose rows would change which ids the routes below hit) and seeds it with
+a large, fixed data set. Then drives the app's routes through
+the Flask test client and records every SQL statement they issue (via the
+sqlite3 trace callback). Each distinct statement is then run through
+EXPLAIN QUERY PLAN and executed once more, inside a rolled-back transaction,
+under a progress handler that counts SQLite VM steps as a row-visit measure.
+
+Fails (exit 1) when:
+  * a statement issued by a HOT_ROUTES request does a full table SCAN and is
+    not marked with an "allow_scan" reason in query_plans.json,
+  * such a statement takes more than ROW_BUDGET VM steps, or
+  * any statement's plan differs from its recorded baseline, or it has no
+    baseline yet; --update records it, keeping existing allow_scan notes.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+BASELINE = "query_plans.json"
+ROW_BUDGET = 50_000   # VM steps per statement on the seeded database
+STEP = 100            # progress handler granularity
+
+SEED_PRODUCTS = 20_000
+SEED_STORES = 200
+SEED_CARTS = 20_000
+SEED_ORDERS = 5_000
+SEED_REQUEST = 90_001  # pending partner request for a store that has products but no partner yet
+CATEGORIES = ["electronics", "dress", "mobile", "sneakers", "beauty", "toys", "sports", "books"]
+# Replaces the admin-edited search_synonyms of the copied database: the search
+# statement has one LIKE group per synonym, so its baseline key must not
+# depend on what admins have entered.
+SEED_SYNONYMS = [("dress", "gown", 0.8), ("dress", "frock", 0.5), ("cap", "hat", 0.8), ("cap", "beanie", 0.5)]
+
+SKIP = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA|EXPLAIN)\b", re.I)
+
+
+# ------------------ Statement capture ------------------
+_captured = {}        # normalized sql -> {"sql": sample, "hot": bool}
+_capture_lock = threading.Lock()
+_hot = threading.local()
+_connect = sqlite3.connect
+
+
+def normalize(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\bNULL\b", "?", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    return re.sub(r"\?(?:\s*,\s*\?)+", "?+", sql)  # IN lists of any length
+
+
+def _trace(sql):
+    if SKIP.match(sql):
+        return
+    key = normalize(sql)
+    with _capture_lock:
+        entry = _captured.setdefault(key, {"sql": sql, "hot": False})
+        # statements from the checkout writer thread count as hot too
+        entry["hot"] = entry["hot"] or getattr(_hot, "on", False) or threading.current_thread().name == "order-writer"
+
+
+def traced_connect(*args, **kwargs):
+    conn = _connect(*args, **kwargs)
+    conn.set_trace_callback(_trace)
+    return conn
+
+
+# ------------------ Seed data ------------------
+def seed(tmpdir):
+    # setup_db.py creates database.db in its working directory
+    env = dict(os.environ, PYTHONPATH=os.path.abspath("."))
+    subprocess.run([sys.executable, os.path.abspath("setup_db.py")], cwd=tmpdir, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    path = os.path.join(tmpdir, "database.db")
+    conn = _connect(path)
+    stores = [f"Store {i}" for i in range(SEED_STORES)]
+    conn.executemany(
+        "INSERT INTO partners (shop_name, owner_name, email, password, phone, created_at) VALUES (?, ?, ?, 'x', ?, '2025-01-01')",
+        [(store, f"Owner {i}", f"owner{i}@example.com", f"+1555{i:06d}") for i, store in enumerate(stores)]
+    )
+    conn.executemany(
+        "INSERT INTO products (name, price, image, description, category, store, stock) VALUES (?, ?, 'p.jpg', ?, ?, ?, ?)",
+        [(f"Product {i}", 10 + i % 90, "A long description " * 20, CATEGORIES[i % len(CATEGORIES)],
+          stores[i % SEED_STORES], 1_000) for i in range(SEED_PRODUCTS)]
+    )
+    conn.execute("UPDATE products SET store_id = (SELECT id FROM partners WHERE shop_name = products.store)")
+    conn.executemany(
+        "INSERT INTO products (name, price, image, description, category, store) VALUES (?, 5, 'p.jpg', '', 'toys', 'Legacy Store')",
+        [(f"Legacy {i}",) for i in range(20)]
+    )
+    conn.executemany(
+        "INSERT INTO partner_requests (id, shop_name, owner_name, phone, email, status, created_at) VALUES (?, ?, 'O', ?, ?, 'pending', '2025-01-01')",
+        [(SEED_REQUEST, "Legacy Store", "+1666000001", "legacy@example.com"),
+         (SEED_REQUEST + 1, "Spam Store", "+1666000002", "spam@example.com")]
+    )
+    conn.execute("DELETE FROM search_synonyms")
+    conn.executemany("INSERT INTO search_synonyms (term, synonym, weight) VALUES (?, ?, ?)", SEED_SYNONYMS)
+    conn.executemany(
+        "INSERT INTO cart (user_id, product_id) VALUES (?, ?)",
+        [(i % 2_000, i * 7 % SEED_PRODUCTS + 1) for i in range(SEED_CARTS)]
+    )
+    conn.executemany("INSERT INTO orders (holder, total, created_at) VALUES ('seed', 0, '2025-01-01')",
+                     [()] * SEED_ORDERS)
+    conn.executemany(
+        "INSERT INTO order_items (order_id, product_id, price, quantity) VALUES (?, ?, 1, 1)",
+        [(i // 3 + 1, i * 13 % SEED_PRODUCTS + 1) for i in range(SEED_ORDERS * 3)]
+    )
+    conn.executemany(
+        "INSERT INTO product_recommendations (product_id, rank, recommended_id, score) VALUES (?, ?, ?, 1)",
+        [(p, r, (p + r) % SEED_PRODUCTS + 1) for p in range(1, SEED_PRODUCTS + 1, 10) for r in range(1, 9)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+# ------------------ Routes to drive ------------------
+# (method, url, kwargs). HOT_ROUTES are the storefront: every statement they
+# issue must be an index lookup within budget.
+HOT_ROUTES = [
+    ("GET", "/", {}),
+    ("GET", "/search?q=red dress", {}),
+    ("GET", "/search-suggestions?query=cap", {}),
+    ("GET", "/product/101", {}),
+    ("GET", "/category/electronics", {}),
+    ("GET", "/shop/Store 7", {}),
+    ("GET", "/shop/Store 7?filter_category=dress", {}),
+    ("POST", "/add-to-cart/101", {"data": {"quantity": "1"}}),
+    ("POST", "/add-to-cart/102", {"data": {"quantity": "2"}}),
+    ("POST", "/update-cart/101", {"json": {"quantity": 3}}),
+    ("GET", "/cart", {}),
+    ("POST", "/checkout/reserve", {}),
+    ("POST", "/checkout/confirm", {}),
+    ("POST", "/add-to-cart/103", {"data": {"quantity": "1"}}),
+    ("POST", "/remove-from-cart/103", {}),
+]
+
+OTHER_ROUTES = [
+    ("POST", "/partner/login", {"data": {"email": "owner3@example.com", "password": "wrong"}}),
+    ("POST", "/partner/register", {"data": {"shop_name": "S", "owner_name": "O", "phone": "1", "email": "owner3@example.com"}}),
+    ("GET", "/partner/dashboard", {"partner": 4}),
+    ("POST", "/product/104/edit", {"partner": 4, "data": {"name": "N", "price": "1", "category": "toys", "description": "d", "stock": "5"}}),
+    ("POST", "/product/105/delete", {"partner": 5}),
+    ("GET", "/admin/partner-requests", {}),
+    ("POST", "/partner/add-product", {"partner": 4, "data": {
+        "name": "N", "price": "1", "category": "toys", "description": "d", "stock": "5",
+        "image": (io.BytesIO(b"x"), "p.jpg")}}),
+    ("GET", "/admin/synonyms?term=cap", {}),
+    ("POST", "/admin/synonyms", {"json": {"term": "cap", "synonym": "lid", "weight": 0.4}}),
+    ("POST", "/admin/synonyms/1/delete", {}),
+    ("POST", f"/admin/handle-request/{SEED_REQUEST}", {}),
+    ("POST", f"/admin/delete-request/{SEED_REQUEST + 1}", {}),
+    ("POST", "/admin/partner/9/delete", {}),
+] + [
+    # WhatsApp product upload, one step per message, from Store 2's phone
+    ("POST", "/whatsapp", {"data": {"From": "whatsapp:+1555000002", **fields}})
+    for fields in ({"Body": "N"}, {"Body": "1"}, {"Body": "d"}, {"Body": "toys"},
+                   {"Body": "", "NumMedia": "1", "MediaUrl0": "https://example.com/p.jpg"})
+]
+
+
+def drive(app):
+    client = app.test_client()
+    for hot, routes in ((True, HOT_ROUTES), (False, OTHER_ROUTES)):
+        for method, url, kwargs in routes:
+            kwargs = dict(kwargs)
+            partner = kwargs.pop("partner", None)
+            if partner:
+                with client.session_transaction() as sess:
+                    sess["partner_id"] = partner
+                    sess["partner_shop"] = f"Store {partner - 1}"
+                    sess["partner_name"] = f"Owner {partner - 1}"
+            _hot.on = hot
+            response = client.open(url, method=method, **kwargs)
+            _hot.on = False
+            if response.status_code >= 500:
+                raise SystemExit(f"{method} {url} failed with {response.status_code}")
+
+
+# ------------------ Plan checks ------------------
+def explain(conn, sql):
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    return [re.sub(r"\b\d+\b", "?", row[-1]) for row in rows]
+
+
+def is_scan(line, tables):
+    # "SCAN products" is a full table scan; "SCAN products USING INDEX ..." walks
+    # an index, and "SCAN r" over a subquery's result isn't a table at all
+    parts = line.split()
+    return parts[0] == "SCAN" and parts[1] in tables and "USING" not in line
+
+
+def count_steps(conn, sql):
+    steps = [0]
+
+    def tick():
+        steps[0] += STEP
+        return 0
+
+    conn.set_progress_handler(tick, STEP)
+    conn.execute("BEGIN")
+    try:
+        conn.execute(sql).fetchall()
+    except sqlite3.IntegrityError:
+        pass  # e.g. re-inserting a row the route already inserted; steps still counted
+    finally:
+        conn.execute("ROLLBACK")
+        conn.set_progress_handler(None, 0)
+    return steps[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="rewrite the baseline from this run")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    path = seed(tmpdir)
+
+    from routes import shop_routes
+    shop_routes.DATABASE = path
+    shop_routes.UPLOAD_FOLDER = tmpdir  # add-product saves its image there
+    from app import app
+    sqlite3.connect = traced_connect
+    shop_routes.reopen_db_after_fork()  # drop the connection app.py warmed up with
+    try:
+        shop_routes.invalidate_catalog()  # GET / then pays for the catalog load, as a hot statement
+        with mock.patch("requests.post"):  # approving a partner request emails via Formspree
+            drive(app)
+    finally:
+        sqlite3.connect = _connect
+
+    try:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    conn = _connect(path, isolation_level=None)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    failures = []   # hot-path rule violations
+    changed = []    # plans that differ from (or are missing in) the baseline
+    results = {}
+    for key, entry in sorted(_captured.items()):
+        plan = explain(conn, entry["sql"])
+        steps = count_steps(conn, entry["sql"])
+        known = baseline.get(key, {})
+        allow = known.get("allow_scan")
+        results[key] = {"hot": entry["hot"], "plan": plan}
+        if allow:
+            results[key]["allow_scan"] = allow
+
+        problems = []
+        if entry["hot"] and not allow:
+            problems += [f"full table scan: {line}" for line in plan if is_scan(line, tables)]
+            if steps > ROW_BUDGET:
+                problems.append(f"{steps} VM steps > budget {ROW_BUDGET}")
+        if problems:
+            failures.append(key)
+        if not known:
+            problems.append("no baseline")
+            changed.append(key)
+        elif known.get("plan") != plan:
+            problems.append(f"plan changed: {known.get('plan')} -> {plan}")
+            changed.append(key)
+        status = "FAIL" if problems else "ok"
+        print(f"[{status}] {'hot ' if entry['hot'] else '    '}{steps:>8} steps  {key[:110]}")
+        for problem in problems:
+            print(f"         {problem}")
+    conn.close()
+    shutil.rmtree(tmpdir)
+
+    if args.update:
+        with open(BASELINE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written: {len(results)} statements -> {BASELINE}")
+    else:
+        failures += changed
+    if failures:
+        # a scan that is really needed gets an "allow_scan" reason in the baseline
+        print(f"{len(set(failures))} statement(s) failed")
+        sys.exit(1)
+    print(f"All {len(results)} statements OK")
+
+
+if __name__ == "__main__":
+    main()
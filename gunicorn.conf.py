@@ -0,0 +1,26 @@
+# Gunicorn config: gunicorn app:app  (picked up automatically from this folder)
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Threaded workers: checkouts arriving together in one worker share a
+# transaction in the order writer (routes/orders.py). With the default sync
+# worker every batch would hold a single checkout.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Import app.py (and warm its caches) once in the master, then fork workers
+# that share the warmed memory copy-on-write instead of each starting cold.
+preload_app = True
+
+# Recycle workers now and then; restarts are cheap because of preload_app
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def post_fork(server, worker):
+    # SQLite handles must never be shared across processes
+    from routes.shop_routes import reopen_db_after_fork
+    reopen_db_after_fork()
@@ -0,0 +1,31 @@
+import sqlite3
+from collections import namedtuple
+
+# ------------------ Listing Rows ------------------
+# Product grids (home, search, category, shop, related lists, cart) only show
+# a card: name, price, image and store. They select exactly these columns into
+# ProductCard, an immutable tuple (namedtuple has no per-instance __dict__),
+# instead of SELECT * into sqlite3.Row with the full description attached.
+# Templates use the same product.name / product['name'] syntax either way.
+# The full row, description included, is only loaded on the product page.
+
+ProductCard = namedtuple("ProductCard", ["id", "name", "price", "image", "store", "category"])
+CARD_COLUMNS = "id, name, price, image, store, category"
+
+# Partner dashboard: card plus what the edit dialog pre-fills
+DASHBOARD_COLUMNS = "id, name, price, image, category, stock, description"
+
+# Search results show a short blurb under each card
+SEARCH_BLURB_LENGTH = 60
+
+
+def card_factory(cursor, row):
+    return ProductCard._make(row)
+
+
+def read_catalog_version(conn):
+    try:
+        row = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None  # database predates the catalog_version table
+    return row[0] if row else 0
@@ -0,0 +1,259 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# ------------------ Orders & Stock ------------------
+# products.stock is the number still available to buy (NULL = not tracked).
+# Checkout first reserves: stock is decremented with a conditional UPDATE
+# (stock >= qty) and a stock_reservations row remembers the hold until it
+# expires. Placing the order turns the hold into orders/order_items rows;
+# expired holds are handed back to stock.
+#
+# All of these writes go through one writer thread per process that
+# group-commits: jobs queued by request threads within BATCH_WAIT of each
+# other share a single BEGIN IMMEDIATE ... COMMIT, each inside its own
+# SAVEPOINT so one failed checkout doesn't undo the others. Under a flash sale
+# this takes the SQLite write lock once per batch instead of once per buyer.
+
+RESERVATION_TTL = 600   # seconds a checkout holds its stock
+BATCH_MAX = 64          # jobs per transaction
+BATCH_WAIT = 0.002      # seconds to collect more jobs once one arrives
+BUSY_TIMEOUT = 10       # seconds to wait for another process' write lock
+SUBMIT_TIMEOUT = 30     # seconds a job may wait in the queue before it is dropped
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id, available):
+        super().__init__(f"Product {product_id}: only {available} left")
+        self.product_id = product_id
+        self.available = available
+
+
+class WriterUnavailable(Exception):
+    """The writer thread died or is too far behind; the job did not run."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "done", "result", "error", "state", "lock")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.state = "queued"  # -> "started" (by the writer) or "dropped" (by submit)
+        self.lock = threading.Lock()
+
+    def claim(self, state):
+        # The writer and a timed-out submitter race for a queued job; one wins
+        with self.lock:
+            if self.state != "queued":
+                return False
+            self.state = state
+            return True
+
+
+class OrderWriter:
+    def __init__(self, database):
+        self.database = database
+        self.pid = os.getpid()
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args):
+        """Run fn(conn, *args) in the next batch and return its result."""
+        job = _Job(fn, args)
+        if not self.thread.is_alive():
+            raise WriterUnavailable("order writer is not running")
+        self.jobs.put(job)
+        deadline = time.monotonic() + SUBMIT_TIMEOUT
+        while not job.done.wait(1):
+            if not self.thread.is_alive():
+                raise WriterUnavailable("order writer stopped")
+            # a job the writer already started runs to completion (bounded by BUSY_TIMEOUT)
+            if time.monotonic() > deadline and job.claim("dropped"):
+                raise WriterUnavailable(f"order writer busy for over {SUBMIT_TIMEOUT}s")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self):
+        conn = sqlite3.connect(self.database, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.monotonic() + BATCH_WAIT
+            while len(batch) < BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            batch = [job for job in batch if job.claim("started")]
+            if batch:
+                self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            release_expired(conn)
+            for job in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    job.result = job.fn(conn, *job.args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    job.error = e
+                conn.execute("RELEASE job")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for job in batch:
+                job.result, job.error = None, job.error or e
+        for job in batch:
+            job.done.set()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(database):
+    # Threads don't survive fork, so a forked worker starts its own writer;
+    # a writer that died (e.g. couldn't open the database) is replaced too
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid() or not _writer.thread.is_alive():
+            _writer = OrderWriter(database)
+        return _writer
+
+
+# ------------------ Jobs (run inside the batch transaction) ------------------
+def _merge(items):
+    totals = {}
+    for product_id, quantity in items:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return totals
+
+
+def _take(conn, product_id, quantity):
+    """Atomically take quantity from stock. Returns False if stock is untracked."""
+    cur = conn.execute(
+        "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+        (quantity, product_id, quantity)
+    )
+    if cur.rowcount:
+        return True
+    row = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()
+    if row is None:
+        raise OutOfStock(product_id, 0)
+    if row[0] is not None:
+        raise OutOfStock(product_id, row[0])
+    return False
+
+
+def _release(conn, where, args):
+    held = conn.execute(
+        f"SELECT product_id, SUM(quantity) FROM stock_reservations WHERE {where} GROUP BY product_id",
+        args
+    ).fetchall()
+    conn.executemany("UPDATE products SET stock = stock + ? WHERE id = ?",
+                     [(qty, product_id) for product_id, qty in held])
+    conn.execute(f"DELETE FROM stock_reservations WHERE {where}", args)
+
+
+def release_expired(conn, now=None):
+    _release(conn, "expires_at < ?", (now or time.time(),))
+
+
+def _reserve(conn, holder, items, ttl):
+    _release(conn, "holder = ?", (holder,))  # a new checkout replaces the old hold
+    expires_at = time.time() + ttl
+    for product_id, quantity in _merge(items).items():
+        if _take(conn, product_id, quantity):
+            conn.execute(
+                "INSERT INTO stock_reservations (holder, product_id, quantity, expires_at) VALUES (?, ?, ?, ?)",
+                (holder, product_id, quantity, expires_at)
+            )
+    return expires_at
+
+
+def _adjust_stock(conn, product_id, old, new):
+    # Apply the partner's edit as a difference, so units sold or reserved while
+    # the edit dialog was open stay taken
+    if new is None:
+        conn.execute("UPDATE products SET stock = NULL WHERE id = ?", (product_id,))
+    elif old is None:
+        conn.execute("UPDATE products SET stock = ? WHERE id = ?", (new, product_id))
+    else:
+        conn.execute(
+            "UPDATE products SET stock = CASE WHEN stock IS NULL THEN ? ELSE MAX(stock + ?, 0) END WHERE id = ?",
+            (new, new - old, product_id)
+        )
+
+
+def _place_order(conn, holder, items, user_id):
+    held = dict(conn.execute(
+        "SELECT product_id, SUM(quantity) FROM stock_reservations WHERE holder = ? GROUP BY product_id",
+        (holder,)
+    ).fetchall())
+    conn.execute("DELETE FROM stock_reservations WHERE holder = ?", (holder,))
+
+    for product_id, quantity in _merge(i[:2] for i in items).items():
+        have = held.pop(product_id, 0)
+        if quantity > have:
+            _take(conn, product_id, quantity - have)  # hold expired or cart grew
+        elif have > quantity:
+            conn.execute("UPDATE products SET stock = stock + ? WHERE id = ?", (have - quantity, product_id))
+    for product_id, qty in held.items():  # items removed from the cart since reserving
+        conn.execute("UPDATE products SET stock = stock + ? WHERE id = ?", (qty, product_id))
+
+    lines = []
+    total = 0
+    for product_id, quantity, size in items:
+        row = conn.execute("SELECT name, price FROM products WHERE id = ?", (product_id,)).fetchone()
+        if row is None:
+            raise OutOfStock(product_id, 0)
+        name, price = row
+        lines.append((product_id, name, price, quantity, size))
+        total += price * quantity
+    total = round(total, 2)
+
+    order_id = conn.execute(
+        "INSERT INTO orders (holder, user_id, total, status, created_at) VALUES (?, ?, ?, 'placed', ?)",
+        (holder, user_id, total, datetime.now())
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO order_items (order_id, product_id, name, price, quantity, size) VALUES (?, ?, ?, ?, ?, ?)",
+        [(order_id,) + line for line in lines]
+    )
+    return order_id, total
+
+
+# ------------------ Public API ------------------
+def reserve_stock(database, holder, items, ttl=RESERVATION_TTL):
+    """Hold stock for items [(product_id, quantity), ...]. Raises OutOfStock."""
+    return get_writer(database).submit(_reserve, holder, list(items), ttl)
+
+
+def release_stock(database, holder):
+    return get_writer(database).submit(_release, "holder = ?", (holder,))
+
+
+def adjust_stock(database, product_id, old, new):
+    """Change stock from old to new (None = untracked) relative to its current value."""
+    if old != new:
+        get_writer(database).submit(_adjust_stock, product_id, old, new)
+
+
+def place_order(database, holder, items, user_id=None):
+    """Create an order from [(product_id, quantity, size), ...], consuming holder's reservation."""
+    return get_writer(database).submit(_place_order, holder, list(items), user_id)
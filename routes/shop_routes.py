@@ -1,16 +1,30 @@
 from flask import (
-    Blueprint, render_template, request,
+    Blueprint, render_template, request, current_app,
     redirect, url_for, session, flash, g, jsonify, Response
 )
+from markupsafe import Markup
 import sqlite3
+import threading
 from datetime import datetime, time
 from werkzeug.security import generate_password_hash, check_password_hash
 import string, random
-import requests
+import uuid
 from werkzeug.utils import secure_filename
 import os
-from functools import wraps
-from twilio.twiml.messaging_response import MessagingResponse
+import math
+import time as _time
+from functools import wraps, lru_cache
+from routes.synonyms import (
+    SynonymMatcher, CHECK_INTERVAL as SYNONYM_CHECK_INTERVAL,
+    load_rows as load_synonym_rows, read_version as read_synonym_version
+)
+from routes.listing import (
+    CARD_COLUMNS, DASHBOARD_COLUMNS, SEARCH_BLURB_LENGTH, card_factory, read_catalog_version
+)
+from routes.orders import OutOfStock, WriterUnavailable, RESERVATION_TTL, adjust_stock, reserve_stock, release_stock, place_order
+
+# NOTE: `requests` and `twilio` are heavy and only needed by the admin approval
+# and WhatsApp routes, so they are imported inside those views on first use.
 
 shop_bp = Blueprint('shop', __name__)
 DATABASE = "database.db"
@@ -34,23 +48,52 @@ def get_db():
         db.row_factory = sqlite3.Row
     return db
 
+# One reusable connection per thread for query_db. The owning pid is stored
+# with it so a worker forked from a preloaded master never reuses the master's
+# SQLite handle (see reopen_db_after_fork / gunicorn.conf.py).
+_local = threading.local()
+
+def _thread_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DATABASE)
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+def reopen_db_after_fork():
+    """Drop any connection inherited from the parent process."""
+    # Never close() the inherited handle: the parent still owns it.
+    _local.__dict__.clear()
+
 def query_db(query, args=(), one=False, commit=False):
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
+    conn = _thread_conn()
     cur = conn.cursor()
     cur.execute(query, args)
     if commit:
         conn.commit()  # commit changes
+    elif conn.in_transaction:
+        conn.rollback()  # uncommitted writes were never kept before either
     if query.strip().upper().startswith("SELECT"):
         rows = cur.fetchall()
         cur.close()
-        conn.close()
         return (rows[0] if rows else None) if one else rows
     else:
         cur.close()
-        conn.close()
         return None
 
+def query_ids(query, args=()):
+    return [row[0] for row in query_db(query, args)]
+
+def query_cards(query, args=()):
+    """Like query_db, but rows come back as ProductCard tuples."""
+    cur = _thread_conn().cursor()
+    cur.row_factory = card_factory
+    rows = cur.execute(query, args).fetchall()
+    cur.close()
+    return rows
+
 
 def execute_db(query, args=()):
     conn = get_db()
@@ -65,6 +108,78 @@ def close_connection(exception):
     if db is not None:
         db.close()
 
+# ------------------ Catalog Cache ------------------
+# Shop list shown in the navbar of nearly every page, plus one shared
+# ProductCard per product that every listing reuses. Built once in the
+# gunicorn master (preload_app) and shared copy-on-write with the workers.
+# Triggers bump catalog_version whenever a card changes; every process polls
+# it at most every CATALOG_CHECK_INTERVAL seconds and reloads only when it
+# moved, so a freshly forked worker keeps the inherited catalog. A process
+# that writes products reloads right away.
+CATALOG_CHECK_INTERVAL = 5
+_catalog = {"version": None, "checked_at": 0.0, "stale": True, "shops": [], "cards": {}}
+
+def load_catalog():
+    version = read_catalog_version(_thread_conn())  # before the load: a later edit is seen next poll
+    cards = {card.id: card for card in query_cards(f"SELECT {CARD_COLUMNS} FROM products ORDER BY id")}
+    _catalog["cards"] = cards
+    _catalog["shops"] = sorted({card.store for card in cards.values() if card.store})
+    _catalog["version"] = version
+    _catalog["checked_at"] = _time.monotonic()
+    _catalog["stale"] = False
+
+def invalidate_catalog():
+    _catalog["stale"] = True
+
+def get_catalog():
+    if _catalog["stale"]:
+        load_catalog()
+    elif _time.monotonic() - _catalog["checked_at"] > CATALOG_CHECK_INTERVAL:
+        _catalog["checked_at"] = _time.monotonic()
+        version = read_catalog_version(_thread_conn())
+        if version is None or version != _catalog["version"]:
+            load_catalog()  # products changed (possibly in another worker)
+    return _catalog
+
+def get_all_shops():
+    return get_catalog()["shops"]
+
+def cards_for(ids):
+    """Cached ProductCards for ids, in order; fetches any added since the last load."""
+    cards = get_catalog()["cards"]
+    missing = [i for i in ids if i not in cards]
+    if missing:
+        marks = ",".join("?" * len(missing))
+        cards = dict(cards)  # copy: other threads may be iterating the shared dict
+        for card in query_cards(f"SELECT {CARD_COLUMNS} FROM products WHERE id IN ({marks})", missing):
+            cards[card.id] = card
+        _catalog["cards"] = cards
+    return [cards[i] for i in ids if i in cards]
+
+# ------------------ Card Fragment Cache ------------------
+# Listing pages call {{ product_card(product, variant) }} for every card. The
+# HTML is cached per (card, variant, blurb, template): a ProductCard is an
+# immutable snapshot of what the card shows, so any product edit produces a new
+# key, and editing _product_card.html loads a new Template object, which does too.
+CARD_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=CARD_CACHE_SIZE)
+def _render_card(template, script_root, card, variant, blurb):
+    return Markup(template.module.product_card(card, variant, blurb))
+
+@shop_bp.app_template_global()
+def product_card(product, variant="grid", blurb=None):
+    template = current_app.jinja_env.get_template("_product_card.html")
+    return _render_card(template, request.script_root, product, variant, blurb)
+
+def warm_caches(app):
+    """Build caches and compile templates up front (called at import in app.py)."""
+    load_catalog()
+    load_synonyms()
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+    reopen_db_after_fork()  # the loader's connection must not leak into workers
+
 # ------------------ Size Options ------------------
 SIZE_OPTIONS = {
     "dress": ["S", "M", "L", "XL", "XXL"],
@@ -74,6 +189,8 @@ SIZE_OPTIONS = {
 }
 
 # ----------------- SEARCH_SYNONYMS -----------------
+# Default dictionary. setup_db.py seeds it into the search_synonyms table, which
+# admins edit from then on; it is only used directly if that table is missing.
 SEARCH_SYNONYMS = {
     "tshirt":    ["tee", "hoodie", "shirt", "innerwear", "top", "casual wear"],
     "shirt":     ["formal", "casual", "button-down", "polo", "blouse"],
@@ -107,13 +224,62 @@ def reset_whatsapp_product_session():
         "data": {}
     }
 
-def expand_keywords(q: str):
-    q_lower = q.lower()
-    extras = []
-    for key, synonyms in SEARCH_SYNONYMS.items():
-        if key in q_lower:
-            extras.extend(synonyms)
-    return extras
+DEFAULT_SYNONYM_WEIGHT = 0.5
+QUERY_WEIGHT = 1.0  # the literal query always outranks its synonyms
+MAX_SEARCH_SYNONYMS = 20  # each one adds 7 parameters and two LIKE groups to the search
+
+_synonyms = {"matcher": None, "checked_at": 0.0}
+
+def load_synonyms():
+    conn = _thread_conn()
+    version = read_synonym_version(conn)
+    if version is None:
+        rows = [(term, syn, DEFAULT_SYNONYM_WEIGHT)
+                for term, syns in SEARCH_SYNONYMS.items() for syn in syns]
+    else:
+        rows = load_synonym_rows(conn)
+    _synonyms["matcher"] = SynonymMatcher(rows, version)
+    _synonyms["checked_at"] = _time.monotonic()
+
+def get_synonym_matcher():
+    matcher = _synonyms["matcher"]
+    if matcher is None:
+        load_synonyms()
+    elif _time.monotonic() - _synonyms["checked_at"] > SYNONYM_CHECK_INTERVAL:
+        _synonyms["checked_at"] = _time.monotonic()
+        if read_synonym_version(_thread_conn()) != matcher.version:
+            load_synonyms()  # an admin edited the table (possibly in another worker)
+    return _synonyms["matcher"]
+
+def expand_keywords_weighted(q: str):
+    """Return {synonym: weight} for the whole-word terms in q."""
+    return get_synonym_matcher().expand(q)
+
+def search_products(q, columns="*", limit=None):
+    """Products matching q or its synonyms, best weighted match first."""
+    expanded = expand_keywords_weighted(q)
+    expanded.pop(q, None)
+    # only the strongest synonyms make it into the SQL
+    top = sorted(expanded.items(), key=lambda kv: (-kv[1], kv[0]))[:MAX_SEARCH_SYNONYMS]
+    keywords = {q: QUERY_WEIGHT, **dict(top)}
+    clauses = []
+    scores = []
+    score_params = []
+    params = []
+    for k, weight in keywords.items():
+        clause = "(name LIKE ? OR description LIKE ? OR category LIKE ?)"
+        clauses.append(clause)
+        params.extend([f"%{k}%"] * 3)
+        scores.append(f"CASE WHEN {clause} THEN ? ELSE 0 END")
+        score_params.extend([f"%{k}%"] * 3 + [weight])
+    sql = f"""
+        SELECT {columns}, ({" + ".join(scores)}) AS relevance FROM products
+        WHERE {" OR ".join(clauses)}
+        ORDER BY relevance DESC, id DESC
+    """
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return query_db(sql, score_params + params)
 
 def partner_required(f):
     @wraps(f)
@@ -136,8 +302,8 @@ def partner_required(f):
 # ------------------ Routes ------------------
 @shop_bp.route('/')
 def home():
-    all_products = query_db("SELECT * FROM products ORDER BY id DESC")
-    all_shops = sorted({p["store"] for p in all_products})
+    all_products = list(reversed(get_catalog()["cards"].values()))  # newest first
+    all_shops = get_all_shops()
     hero_products = all_products[:4]  # Top 4 latest products for hero cards
     # Optional: You can create a separate table for hero slides if needed
     hero_slides = all_products[:3]  # First 3 products as carousel slides
@@ -152,18 +318,7 @@ def search_suggestions():
     q = request.args.get('query', '').strip()
     results = []
     if q:
-        keywords = [q] + expand_keywords(q)
-        clauses = []
-        params = []
-        for k in keywords:
-            clauses.append("(name LIKE ? OR description LIKE ? OR category LIKE ?)")
-            params.extend([f"%{k}%"] * 3)
-        sql = f"""
-            SELECT id, name FROM products
-            WHERE {" OR ".join(clauses)}
-            LIMIT 5
-        """
-        rows = query_db(sql, params)
+        rows = search_products(q, columns="id, name", limit=5)
         results = [{"id": r["id"], "name": r["name"]} for r in rows]
     return jsonify(results)
 
@@ -172,20 +327,29 @@ def search_suggestions():
 def search():
     q = request.args.get('q', '').strip()
     products = []
+    blurbs = {}
     if q:
-        keywords = [q] + expand_keywords(q)
-        clauses = []
-        params = []
-        for k in keywords:
-            clauses.append("(name LIKE ? OR description LIKE ? OR category LIKE ?)")
-            params.extend([f"%{k}%"] * 3)
-        sql = f"""
-            SELECT * FROM products
-            WHERE {" OR ".join(clauses)}
-            ORDER BY id DESC
-        """
-        products = query_db(sql, params)
-    return render_template('search_results.html', products=products, query=q)
+        rows = search_products(q, columns=f"id, substr(description, 1, {SEARCH_BLURB_LENGTH}) AS blurb")
+        products = cards_for([r["id"] for r in rows])
+        blurbs = {r["id"]: r["blurb"] or "" for r in rows}
+    return render_template('search_results.html', products=products, blurbs=blurbs, query=q)
+
+
+# ------------------ Frequently Bought Together ------------------
+# product_recommendations is precomputed by build_recommendations.py
+def bought_together(product_ids, limit=8):
+    if not product_ids:
+        return []
+    marks = ",".join("?" * len(product_ids))
+    return cards_for(query_ids(f"""
+        SELECT p.id FROM (
+            SELECT recommended_id, SUM(score) AS score FROM product_recommendations
+            WHERE product_id IN ({marks}) AND recommended_id NOT IN ({marks})
+            GROUP BY recommended_id
+        ) r JOIN products p ON p.id = r.recommended_id
+        ORDER BY r.score DESC, p.id DESC
+        LIMIT {int(limit)}
+    """, list(product_ids) * 2))
 
 
 @shop_bp.route('/product/<int:product_id>')
@@ -193,13 +357,17 @@ def product_page(product_id):
     product = query_db("SELECT * FROM products WHERE id=?", [product_id], one=True)
     if not product:
         return "Product not found", 404
-    related = query_db("SELECT * FROM products WHERE category=? AND id!=?", [product["category"], product_id])
-    same_store = query_db("SELECT * FROM products WHERE store=? AND id!=?", [product["store"], product_id])
-    all_shops = sorted({p["store"] for p in query_db("SELECT * FROM products")})
+    related = cards_for(query_ids("SELECT id FROM products WHERE category=? AND id!=?", [product["category"], product_id]))
+    if product["store_id"] is not None:
+        same_store = cards_for(query_ids("SELECT id FROM products WHERE store_id=? AND id!=?", [product["store_id"], product_id]))
+    else:  # legacy product whose store never matched a partner
+        same_store = cards_for(query_ids("SELECT id FROM products WHERE store=? AND id!=?", [product["store"], product_id]))
+    all_shops = get_all_shops()
     return render_template('product.html',
                            product=product,
                            related_products=related,
                            store_products=same_store,
+                           bought_together=bought_together([product_id]),
                            all_shops=all_shops)
 
 # ------------------ Cart ------------------
@@ -208,9 +376,14 @@ def get_cart_items():
     cart_items = []
     subtotal = 0
     updated_cart = []
-    
+
+    # One query for the whole cart; prices come straight from the DB, not the cache
+    ids = list({item["id"] for item in cart})
+    marks = ",".join("?" * len(ids))
+    prods = {r["id"]: r for r in query_db(f"SELECT id, price, image, store FROM products WHERE id IN ({marks})", ids)} if ids else {}
+
     for item in cart:
-        prod = query_db("SELECT * FROM products WHERE id=?", [item["id"]], one=True)
+        prod = prods.get(item["id"])
         if not prod:
             continue  # Skip if product deleted
         qty = item.get("quantity", 1)
@@ -229,12 +402,13 @@ def get_cart_quantity():
 @shop_bp.route('/cart')
 def view_cart():
     cart_items, subtotal = get_cart_items()
-    products = query_db("SELECT * FROM products")
-    all_shops = sorted({p["store"] for p in products})
+    products = list(get_catalog()["cards"].values())
+    all_shops = get_all_shops()
     return render_template("cart.html",
                            cart_items=cart_items,
                            subtotal=subtotal,
                            shipping=10,
+                           bought_together=bought_together({item["id"] for item in cart_items}),
                            all_products=products,
                            all_shops=all_shops)
 
@@ -256,6 +430,10 @@ def add_to_cart(product_id):
     if not valid_sizes:
         size = None
     cart = session.setdefault("cart", [])
+    in_cart = sum(item["quantity"] for item in cart if item["id"] == product["id"])
+    if product["stock"] is not None and in_cart + quantity > product["stock"]:
+        flash(f"Only {product['stock']} × {product['name']} left in stock.", "danger")
+        return redirect(request.referrer or url_for('shop.product_page', product_id=product_id))
     for item in cart:
         if item["id"] == product["id"] and item.get("size") == size:
             item["quantity"] += quantity
@@ -282,6 +460,13 @@ def update_cart(product_id):
     cart = session.get('cart', [])
     item_total = 0
     subtotal = 0
+    message = None
+
+    # Cap at what's in stock (a soft check; checkout reserves for real)
+    product = query_db("SELECT stock FROM products WHERE id=?", [product_id], one=True)
+    if product and product["stock"] is not None and quantity > product["stock"]:
+        quantity = product["stock"]
+        message = f"Only {quantity} left in stock."
 
     for item in cart[:]:  # Copy of list for safe removal
         if item['id'] == product_id:
@@ -304,7 +489,9 @@ def update_cart(product_id):
         "success": True,
         "cart_quantity": get_cart_quantity(),
         "item_total": item_total,
-        "subtotal": subtotal
+        "subtotal": subtotal,
+        "quantity": quantity,
+        "message": message
     })
 
 # ------------------ Remove Item from Cart ------------------
@@ -324,11 +511,61 @@ def remove_from_cart(product_id):
     })
 
 
+# ------------------ Checkout ------------------
+def checkout_holder():
+    # Identifies this browser's stock reservation
+    return session.setdefault("checkout_id", uuid.uuid4().hex)
+
+@shop_bp.route('/checkout/reserve', methods=['POST'])
+def checkout_reserve():
+    cart = session.get('cart', [])
+    if not cart:
+        return jsonify({"success": False, "error": "Your cart is empty."})
+    try:
+        reserve_stock(DATABASE, checkout_holder(), [(item['id'], item['quantity']) for item in cart])
+    except OutOfStock as e:
+        name = next((item['name'] for item in cart if item['id'] == e.product_id), "An item")
+        return jsonify({"success": False, "error": f"{name}: only {e.available} left in stock."})
+    except WriterUnavailable as e:
+        print("Checkout unavailable:", e)
+        return jsonify({"success": False, "error": "Checkout is busy, please try again."}), 503
+    _, subtotal = get_cart_items()
+    return jsonify({"success": True, "subtotal": round(subtotal, 2),
+                    "hold_minutes": RESERVATION_TTL // 60})
+
+@shop_bp.route('/checkout/confirm', methods=['POST'])
+def checkout_confirm():
+    cart = session.get('cart', [])
+    if not cart:
+        return jsonify({"success": False, "error": "Your cart is empty."})
+    try:
+        order_id, total = place_order(DATABASE, checkout_holder(),
+                                      [(item['id'], item['quantity'], item.get('size')) for item in cart],
+                                      session.get('user_id'))
+    except OutOfStock as e:
+        name = next((item['name'] for item in cart if item['id'] == e.product_id), "An item")
+        return jsonify({"success": False, "error": f"{name}: only {e.available} left in stock."})
+    except WriterUnavailable as e:
+        print("Checkout unavailable:", e)
+        return jsonify({"success": False, "error": "Checkout is busy, please try again."}), 503
+    session['cart'] = []
+    session.modified = True
+    return jsonify({"success": True, "order_id": order_id, "total": total})
+
+@shop_bp.route('/checkout/cancel', methods=['POST'])
+def checkout_cancel():
+    try:
+        release_stock(DATABASE, checkout_holder())
+    except WriterUnavailable:
+        pass  # the hold expires on its own after RESERVATION_TTL
+    return jsonify({"success": True})
+
+
 # ------------------ Category & Shop Pages ------------------
 @shop_bp.route('/category/<string:category_name>')
 def category_page(category_name):
-    filtered = query_db("SELECT * FROM products WHERE LOWER(category)=?", [category_name.lower()])
-    all_shops = sorted({p["store"] for p in query_db("SELECT * FROM products")})
+    filtered = cards_for(query_ids("SELECT id FROM products WHERE LOWER(category)=?", [category_name.lower()]))
+    all_shops = get_all_shops()
     return render_template('category.html',
                            category_name=category_name.title(),
                            products=filtered,
@@ -337,11 +574,18 @@ def category_page(category_name):
 @shop_bp.route('/shop/<string:shop_name>')
 def shop_page(shop_name):
     filter_cat = request.args.get("filter_category")
-    store_products = query_db("SELECT * FROM products WHERE LOWER(store)=?", [shop_name.lower()])
+    # Products with no store_id (no partner, or a name several partners share)
+    # are still matched by name
+    all_store_products = cards_for(query_ids("""
+        SELECT id FROM products
+        WHERE store_id IN (SELECT id FROM partners WHERE LOWER(shop_name)=?)
+           OR (store_id IS NULL AND LOWER(store)=?)
+    """, [shop_name.lower(), shop_name.lower()]))
+    store_products = all_store_products
     if filter_cat:
-        store_products = [p for p in store_products if p["category"].lower() == filter_cat.lower()]
-    store_categories = sorted({p["category"] for p in query_db("SELECT * FROM products WHERE LOWER(store)=?", [shop_name.lower()])})
-    all_shops = sorted({p["store"] for p in query_db("SELECT * FROM products")})
+        store_products = [p for p in store_products if p.category.lower() == filter_cat.lower()]
+    store_categories = sorted({p.category for p in all_store_products})
+    all_shops = get_all_shops()
     return render_template('shop.html',
                            shop_name=shop_name.title(),
                            store_products=store_products,
@@ -414,8 +658,11 @@ def partner_login():
 @partner_required
 def partner_dashboard():
     partner_id = session['partner_id']
-    shop_name = session['partner_shop']
-    products = query_db("SELECT * FROM products WHERE LOWER(store)=?", [shop_name.lower()])
+    # plus unassigned products listed under the partner's shop name
+    products = query_db(
+        f"SELECT {DASHBOARD_COLUMNS} FROM products WHERE store_id=? OR (store_id IS NULL AND LOWER(store)=?)",
+        [partner_id, session['partner_shop'].lower()]
+    )
     return render_template('partner_dashboard.html', products=products, partner_name=session['partner_name'])
 
 
@@ -436,11 +683,20 @@ def add_product():
     price = request.form.get("price", "").strip()
     category = request.form.get("category", "").strip()
     description = request.form.get("description", "").strip()
+    stock = request.form.get("stock", "").strip()
     store = session.get("partner_shop")
 
     if not name or not price or not category or not store:
         flash("Please fill all required fields!", "danger")
         return redirect(url_for("shop.partner_dashboard"))
+    try:
+        stock = int(stock) if stock else None
+    except ValueError:
+        flash("Stock must be a whole number", "danger")
+        return redirect(url_for("shop.partner_dashboard"))
+    if stock is not None and stock < 0:
+        flash("Stock can't be negative", "danger")
+        return redirect(url_for("shop.partner_dashboard"))
 
     image_file = request.files.get("image")
     image_name = None
@@ -455,9 +711,10 @@ def add_product():
 
     try:
         execute_db("""
-            INSERT INTO products (name, price, image, description, category, store)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, [name, float(price), image_name, description, category, store])
+            INSERT INTO products (name, price, image, description, category, store, store_id, stock)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [name, float(price), image_name, description, category, store, session['partner_id'], stock])
+        invalidate_catalog()
         flash("Product added successfully!", "success")
     except Exception as e:
         flash(f"Error adding product: {e}", "danger")
@@ -481,12 +738,35 @@ def edit_product(product_id):
         price = request.form['price']
         category = request.form['category']
         description = request.form['description']
+        stock = request.form.get('stock', '').strip()
+        # stock_was is the value the dialog was rendered with; only the
+        # partner's change is applied, through the order writer
+        stock_was = request.form.get('stock_was')
+        try:
+            stock = int(stock) if stock else None
+            if stock_was is None:
+                stock_was = product['stock']
+            else:
+                stock_was = int(stock_was) if stock_was.strip() else None
+        except ValueError:
+            flash("Stock must be a whole number", "danger")
+            return redirect(url_for('shop.partner_dashboard'))
+        if stock is not None and stock < 0:
+            flash("Stock can't be negative", "danger")
+            return redirect(url_for('shop.partner_dashboard'))
+
         db.execute("""
             UPDATE products
             SET name=?, price=?, category=?, description=?
             WHERE id=?
         """, (name, price, category, description, product_id))
         db.commit()
+        invalidate_catalog()
+        try:
+            adjust_stock(DATABASE, product_id, stock_was, stock)
+        except WriterUnavailable:
+            flash("Product saved, but the stock change didn't go through. Please try again.", "warning")
+            return redirect(url_for('shop.partner_dashboard'))
         flash("Product updated successfully!", "success")
         return redirect(url_for('shop.partner_dashboard'))
 
@@ -494,12 +774,26 @@ def edit_product(product_id):
 
 
 # ---- Delete Product ----
+def delete_products(db, ids):
+    """Delete products ids and every row pointing at them (caller commits)."""
+    marks = ",".join("?" * len(ids))
+    db.execute(f"DELETE FROM cart WHERE product_id IN ({marks})", ids)
+    # only live checkout holds, so small enough to scan; an index on
+    # product_id would pull the expiry sweep off idx_reservations_expires
+    db.execute(f"DELETE FROM stock_reservations WHERE product_id IN ({marks})", ids)
+    db.execute(f"DELETE FROM product_pairs WHERE product_a IN ({marks})", ids)
+    db.execute(f"DELETE FROM product_pairs WHERE product_b IN ({marks})", ids)
+    db.execute(f"DELETE FROM product_recommendations WHERE product_id IN ({marks})", ids)
+    db.execute(f"DELETE FROM product_recommendations WHERE recommended_id IN ({marks})", ids)
+    db.execute(f"DELETE FROM products WHERE id IN ({marks})", ids)
+
 @shop_bp.route('/product/<int:product_id>/delete', methods=['POST'])
 @partner_required
 def delete_product(product_id):
     db = get_db()
-    db.execute("DELETE FROM products WHERE id = ?", (product_id,))
+    delete_products(db, [product_id])
     db.commit()
+    invalidate_catalog()
     flash("Product deleted successfully!", "success")
     return redirect(url_for('shop.partner_dashboard'))
 
@@ -522,6 +816,8 @@ def admin_partner_requests():
 
 @shop_bp.route('/admin/handle-request/<int:request_id>', methods=['POST'])
 def handle_request(request_id):
+    import requests  # lazy: only this route talks to Formspree
+
     # Fetch partner request
     req = query_db("SELECT * FROM partner_requests WHERE id=?", [request_id], one=True)
     if not req:
@@ -542,6 +838,13 @@ def handle_request(request_id):
     # Update request status
     execute_db("UPDATE partner_requests SET status=? WHERE id=?", ["approved", request_id])
 
+    # Attach any existing products listed under this shop name to the new
+    # partner, unless another partner already uses the name (then it's ambiguous)
+    execute_db("""
+        UPDATE products SET store_id=? WHERE store_id IS NULL AND LOWER(store)=?
+        AND NOT EXISTS (SELECT 1 FROM partners WHERE LOWER(shop_name)=? AND id!=?)
+    """, [partner_id, req['shop_name'].lower(), req['shop_name'].lower(), partner_id])
+
     # Send email via Formspree (optional)
     formspree_url = "https://formspree.io/f/xwprvoqy"
     data = {
@@ -564,6 +867,8 @@ def delete_request(request_id):
     execute_db("UPDATE partner_requests SET status='deleted' WHERE id=?", [request_id])
     return jsonify({"success": True})
 
+DELETE_CHUNK = 500  # products removed per transaction when deleting a partner
+
 @shop_bp.route('/admin/partner/<int:partner_id>/delete', methods=['POST'])
 def admin_delete_partner(partner_id):
     print("Delete partner route hit:", partner_id)
@@ -584,26 +889,72 @@ def admin_delete_partner(partner_id):
     shop_name = partner['shop_name']
 
     try:
-        # Delete cart items for this partner's products
-        db.execute("""
-            DELETE FROM cart
-            WHERE product_id IN (
-                SELECT id FROM products WHERE store = ?
-            )
-        """, (shop_name,))
-
-        # Delete products
-        db.execute("DELETE FROM products WHERE store = ?", (shop_name,))
+        # Delete products (and every row pointing at them) a chunk at a time,
+        # committing in between so a huge store never holds the write lock for
+        # long. The partner row goes last, so a failed run can simply be retried.
+        while True:
+            ids = [r[0] for r in db.execute(
+                "SELECT id FROM products WHERE store_id = ? LIMIT ?", (partner_id, DELETE_CHUNK)
+            )]
+            if not ids:
+                break
+            delete_products(db, ids)
+            db.commit()
 
         # Delete partner account
         db.execute("DELETE FROM partners WHERE id = ?", (partner_id,))
 
         db.commit()
+        invalidate_catalog()
         return jsonify({"success": True, "message": f"Partner '{shop_name}' deleted"})
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "error": str(e)})
 
+# ------------------ Admin: Search Synonyms ------------------
+@shop_bp.route('/admin/synonyms')
+def admin_synonyms():
+    term = request.args.get('term', '').strip().lower()
+    if term:
+        rows = query_db("SELECT id, term, synonym, weight FROM search_synonyms WHERE term=? ORDER BY weight DESC", [term])
+    else:
+        rows = query_db("SELECT id, term, synonym, weight FROM search_synonyms ORDER BY term, weight DESC LIMIT 500")
+    return jsonify([dict(r) for r in rows])
+
+@shop_bp.route('/admin/synonyms', methods=['POST'])
+def admin_save_synonym():
+    data = request.get_json(silent=True) or request.form
+    term = data.get('term') or ''
+    synonym = data.get('synonym') or ''
+    if not isinstance(term, str) or not isinstance(synonym, str):
+        return jsonify({"success": False, "error": "Term and synonym must be text"}), 400
+    term = term.strip().lower()
+    synonym = synonym.strip().lower()
+    weight = data.get('weight')
+    if weight is None or weight == '':
+        weight = DEFAULT_SYNONYM_WEIGHT
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Weight must be a number"}), 400
+    if weight < 0 or not math.isfinite(weight):
+        return jsonify({"success": False, "error": "Weight must be a finite number >= 0"}), 400
+    if not term or not synonym:
+        return jsonify({"success": False, "error": "Term and synonym are required"}), 400
+
+    execute_db("""
+        INSERT INTO search_synonyms (term, synonym, weight) VALUES (?, ?, ?)
+        ON CONFLICT(term, synonym) DO UPDATE SET weight=excluded.weight
+    """, [term, synonym, weight])
+    load_synonyms()  # other workers pick it up via the version row
+    return jsonify({"success": True})
+
+@shop_bp.route('/admin/synonyms/<int:synonym_id>/delete', methods=['POST'])
+def admin_delete_synonym(synonym_id):
+    execute_db("DELETE FROM search_synonyms WHERE id=?", [synonym_id])
+    load_synonyms()
+    return jsonify({"success": True})
+
 @shop_bp.route('/whatsapp', methods=['POST'])
 def whatsapp():
     from twilio.twiml.messaging_response import MessagingResponse
@@ -696,10 +1047,11 @@ def whatsapp():
             store_name = partner["name"] if isinstance(partner, dict) else partner[1]
 
             query_db(
-                "INSERT INTO products (name, price, description, category, store, image) VALUES (?, ?, ?, ?, ?, ?)",
-                [data["name"], data["price"], data["description"], data["category"], store_name, data["image"]],
+                "INSERT INTO products (name, price, description, category, store, store_id, image) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [data["name"], data["price"], data["description"], data["category"], store_name, partner["id"], data["image"]],
                 commit=True
             )
+            invalidate_catalog()
 
             msg.body("✅ Product uploaded successfully with your image!")
             # Clear session
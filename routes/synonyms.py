@@ -0,0 +1,89 @@
+import re
+import sqlite3
+
+# ------------------ Synonym Matcher ------------------
+# Synonyms live in the `search_synonyms` table (see setup_db.py) and are
+# compiled into a token-hash matcher: phrases are keyed by their token tuple,
+# so expanding a query costs O(query tokens * longest phrase) dict lookups no
+# matter how many synonyms are stored. Triggers bump search_synonyms_version on
+# every edit; each process polls that single row and recompiles when it moves.
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+WORD_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+CHECK_INTERVAL = 5  # seconds between version polls
+
+
+def tokenize(text):
+    # Hyphens separate tokens, so "t-shirt" matches the term "shirt"
+    return TOKEN_RE.findall(text.lower())
+
+
+def singulars(word):
+    """Candidate singular forms of an English plural, most likely first."""
+    if len(word) <= 3 or not word.endswith("s"):
+        return []
+    forms = [word[:-1]]                           # bags -> bag, shoes -> shoe
+    if word.endswith("ies") and len(word) > 4:
+        forms.append(word[:-3] + "y")             # accessories -> accessory
+    elif word.endswith("es") and len(word) > 4:
+        forms.append(word[:-2])                   # watches -> watch, dresses -> dress
+    return forms
+
+
+class SynonymMatcher:
+    __slots__ = ("phrases", "max_len", "version")
+
+    def __init__(self, rows, version=0):
+        # rows: iterable of (term, synonym, weight)
+        self.phrases = {}
+        self.max_len = 1
+        self.version = version
+        for term, synonym, weight in rows:
+            key = tuple(tokenize(term))
+            if not key:
+                continue
+            self.phrases.setdefault(key, {})
+            # Same synonym listed twice for a term: keep the stronger weight
+            prev = self.phrases[key].get(synonym, 0.0)
+            self.phrases[key][synonym] = max(prev, float(weight))
+            self.max_len = max(self.max_len, len(key))
+
+    def _lookup(self, key):
+        hit = self.phrases.get(key)
+        if hit is None:
+            for singular in singulars(key[-1]):
+                hit = self.phrases.get(key[:-1] + (singular,))
+                if hit is not None:
+                    break
+        return hit
+
+    def expand(self, query):
+        """Return {synonym: weight} for every whole-word term found in query."""
+        tokens = tokenize(query)
+        keys = [tuple(tokens[i:i + n])
+                for i in range(len(tokens))
+                for n in range(1, min(self.max_len, len(tokens) - i) + 1)]
+        # a hyphenated word also matches its joined spelling: "t-shirt" -> "tshirt"
+        keys += [(word.replace("-", ""),) for word in WORD_RE.findall(query.lower()) if "-" in word]
+        found = {}
+        for key in keys:
+            hit = self._lookup(key)
+            if not hit:
+                continue
+            for synonym, weight in hit.items():
+                if weight > found.get(synonym, 0.0):
+                    found[synonym] = weight
+        return found
+
+
+def load_rows(conn):
+    rows = conn.execute("SELECT term, synonym, weight FROM search_synonyms").fetchall()
+    return [(r[0], r[1], r[2]) for r in rows]
+
+
+def read_version(conn):
+    try:
+        row = conn.execute("SELECT version FROM search_synonyms_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None  # database predates the synonyms table
+    return row[0] if row else 0
@@ -28,11 +28,17 @@ products = [
     ("Slippers", 29.99, "slippers1.jpg", "Cozy slippers for indoor use.", "slippers", "Fashion Hub")
 ]
 
-# Insert products
-c.executemany("""
-INSERT INTO products (name, price, image, description, category, store)
-VALUES (?, ?, ?, ?, ?, ?)
-""", products)
+# Insert products (only into an empty table, so this script can be re-run
+# against an existing database to apply the newer tables below)
+if c.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 0:
+    c.executemany("""
+    INSERT INTO products (name, price, image, description, category, store)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, products)
+
+# Stock per product (NULL = not tracked); added to older databases in place
+if "stock" not in [col[1] for col in c.execute("PRAGMA table_info(products)")]:
+    c.execute("ALTER TABLE products ADD COLUMN stock INTEGER")
 
 # ------------------ Partner Requests Table ------------------
 c.execute("""
@@ -87,6 +93,180 @@ CREATE TABLE IF NOT EXISTS whatsapp_uploads (
 )
 """)
 
+# ------------------ Search Synonyms Table ------------------
+c.execute("""
+CREATE TABLE IF NOT EXISTS search_synonyms (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    term TEXT NOT NULL,
+    synonym TEXT NOT NULL,
+    weight REAL NOT NULL DEFAULT 0.5,
+    UNIQUE (term, synonym)
+)
+""")
+
+# Single-row version counter bumped by triggers; app workers poll it to
+# hot-reload their compiled synonym matcher after an edit.
+c.execute("""
+CREATE TABLE IF NOT EXISTS search_synonyms_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+""")
+c.execute("INSERT OR IGNORE INTO search_synonyms_version (id, version) VALUES (1, 0)")
+for event in ("INSERT", "UPDATE", "DELETE"):
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS search_synonyms_{event.lower()}
+    AFTER {event} ON search_synonyms
+    BEGIN
+        UPDATE search_synonyms_version SET version = version + 1 WHERE id = 1;
+    END
+    """)
+
+if c.execute("SELECT COUNT(*) FROM search_synonyms").fetchone()[0] == 0:
+    from routes.shop_routes import SEARCH_SYNONYMS, DEFAULT_SYNONYM_WEIGHT
+    c.executemany(
+        "INSERT OR IGNORE INTO search_synonyms (term, synonym, weight) VALUES (?, ?, ?)",
+        [(term, syn, DEFAULT_SYNONYM_WEIGHT) for term, syns in SEARCH_SYNONYMS.items() for syn in syns]
+    )
+
+# ------------------ Orders & Reservations ------------------
+c.execute("""
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    holder TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+)
+""")
+c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_holder ON stock_reservations (holder)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_expires ON stock_reservations (expires_at)")
+
+c.execute("""
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    holder TEXT NOT NULL,
+    user_id INTEGER,
+    total REAL NOT NULL,
+    status TEXT DEFAULT 'placed',
+    created_at TEXT
+)
+""")
+
+c.execute("""
+CREATE TABLE IF NOT EXISTS order_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    name TEXT,
+    price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    size TEXT
+)
+""")
+c.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+
+# ------------------ Recommendations ------------------
+# Filled by build_recommendations.py. Both are WITHOUT ROWID tables keyed for
+# the lookups they serve: all partners of a product / its ranked top-K.
+c.execute("""
+CREATE TABLE IF NOT EXISTS product_pairs (
+    product_a INTEGER NOT NULL,
+    product_b INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (product_a, product_b)
+) WITHOUT ROWID
+""")
+
+c.execute("""
+CREATE TABLE IF NOT EXISTS product_recommendations (
+    product_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    recommended_id INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (product_id, rank)
+) WITHOUT ROWID
+""")
+
+c.execute("""
+CREATE TABLE IF NOT EXISTS recommendation_state (
+    source TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+)
+""")
+
+# Products whose pair counts changed but whose top-K isn't rebuilt yet
+c.execute("""
+CREATE TABLE IF NOT EXISTS recommendation_dirty (
+    product_id INTEGER PRIMARY KEY
+)
+""")
+c.execute("CREATE INDEX IF NOT EXISTS idx_cart_user ON cart (user_id)")
+# reverse lookups, for removing a deleted product's rows
+c.execute("CREATE INDEX IF NOT EXISTS idx_product_pairs_b ON product_pairs (product_b)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_recommended ON product_recommendations (recommended_id)")
+
+# ------------------ Store Foreign Key ------------------
+# products.store stays as the display name; store_id is the owning partner.
+# Backfill matches existing rows to partners by case-insensitive shop name.
+# shop_name isn't unique: a name shared by several partners can't say whose
+# products they are, so those stay NULL (listed below) along with products
+# whose store has no partner account.
+if "store_id" not in [col[1] for col in c.execute("PRAGMA table_info(products)")]:
+    c.execute("ALTER TABLE products ADD COLUMN store_id INTEGER REFERENCES partners (id)")
+c.execute("""
+UPDATE products SET store_id = (
+    SELECT MIN(p.id) FROM partners p WHERE LOWER(p.shop_name) = LOWER(products.store)
+    HAVING COUNT(*) = 1
+)
+WHERE store_id IS NULL
+""")
+for shop_name, partner_ids, products in c.execute("""
+    SELECT LOWER(shop_name), GROUP_CONCAT(id),
+           (SELECT COUNT(*) FROM products WHERE store_id IS NULL AND LOWER(store) = LOWER(partners.shop_name))
+    FROM partners GROUP BY LOWER(shop_name) HAVING COUNT(*) > 1
+""").fetchall():
+    if products:
+        print(f"store_id not set for {products} product(s) of '{shop_name}': shared by partners {partner_ids}")
+
+# ------------------ Catalog Version ------------------
+# Bumped by triggers whenever a product's card changes (not on stock updates,
+# which checkout does constantly); app workers poll it to refresh their
+# cached catalog.
+c.execute("""
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+""")
+c.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+for name, event in (("insert", "INSERT"), ("delete", "DELETE"),
+                    ("update", "UPDATE OF name, price, image, store, category")):
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS catalog_{name}
+    AFTER {event} ON products
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    """)
+
+# ------------------ Indexes ------------------
+# Every hot-path query should be an index lookup; check_query_plans.py
+# fails if one turns into a table scan.
+c.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_products_store ON products (store)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_products_lower_category ON products (LOWER(category))")
+c.execute("CREATE INDEX IF NOT EXISTS idx_products_lower_store ON products (LOWER(store))")
+c.execute("CREATE INDEX IF NOT EXISTS idx_products_store_id ON products (store_id)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_partners_lower_shop_name ON partners (LOWER(shop_name))")
+c.execute("CREATE INDEX IF NOT EXISTS idx_cart_product ON cart (product_id)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_partners_phone ON partners (phone)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_partner_requests_email ON partner_requests (email)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_partner_requests_status ON partner_requests (status, created_at)")
+
 conn.commit()
+
+# WAL lets readers keep going while checkout holds the write lock
+conn.execute("PRAGMA journal_mode=WAL")
 conn.close()
 print("Database setup complete!")